@@ -1,2 +1,2 @@
 #!/bin/bash
-shards build
\ No newline at end of file
+shards build -Dpreview_mt
\ No newline at end of file
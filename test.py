@@ -1,7 +1,10 @@
 from glob import glob
-from os import path
+from json import dump
+from os import path, wait4, waitstatus_to_exitcode
 from sys import argv
-from subprocess import Popen, PIPE, STDOUT, TimeoutExpired
+from subprocess import Popen, PIPE, STDOUT
+from threading import Timer
+from time import perf_counter
 
 with open('env', 'r') as file:
     crafting_interpreters_dir = file.read()
@@ -1104,15 +1107,118 @@ chapters = {
     ]
 }
 
-# Check program arguments.
-arg_length = len(argv)
+
+def measure(command, timeout, stderr=STDOUT):
+    '''Run a command and return its output, as bytes, along with its wall
+    time, user and system CPU time, peak resident set size and whether it was
+    killed for running past the timeout.'''
+    start = perf_counter()
+    process = Popen(command, stdin=PIPE, stdout=PIPE, stderr=stderr)
+    process.stdin.close()
+    timed_out = []
+
+    def kill():
+        timed_out.append(True)
+        process.kill()
+
+    timer = Timer(timeout, kill)
+    timer.start()
+
+    try:
+        output = process.stdout.read()
+    finally:
+        timer.cancel()
+        process.stdout.close()
+
+    # Reap the process here, instead of through Popen, to get its resource
+    # usage.
+    _, status, usage = wait4(process.pid, 0)
+    process.returncode = waitstatus_to_exitcode(status)
+
+    metrics = {
+        'wall_seconds': perf_counter() - start,
+        'user_seconds': usage.ru_utime,
+        'system_seconds': usage.ru_stime,
+        'peak_rss_kb': usage.ru_maxrss,
+        'timed_out': bool(timed_out),
+    }
+
+    return output, metrics
+
+
+def describe(metrics):
+    '''Format a test's metrics for the results file.'''
+    if metrics is None:
+        return 'not measured'
+
+    description = (f'wall {metrics["wall_seconds"]:.3f}s, user {metrics["user_seconds"]:.3f}s, '
+                   f'sys {metrics["system_seconds"]:.3f}s, peak RSS {metrics["peak_rss_kb"]} KB')
+
+    if metrics['timed_out']:
+        description += ', timed out'
+
+    return description
+
+
+def run_batch(interpreter, tests):
+    '''Run every test in one interpreter process and split its framed output
+    into the output of each test.'''
+    output, metrics = measure([*interpreter, '--batch', *tests], 10 * len(tests), stderr=None)
+
+    # Each record is a header line of exit status, output size in bytes and
+    # test path, followed by the test's output. A batch that was killed can
+    # end in the middle of a record, so parsing stops at the first header
+    # that can't be read, and the tests after it have no output.
+    outputs = {}
+    offset = 0
+
+    while offset < len(output):
+        end = output.find(b'\n', offset)
+
+        if end == -1:
+            break
+
+        header = output[offset:end].decode(errors='replace').split(' ', 2)
+
+        if len(header) != 3 or not header[1].isdigit():
+            break
+
+        _, size, test = header
+        start = end + 1
+        outputs[test] = output[start:start + int(size)].decode(errors='replace')
+        offset = start + int(size)
+
+    return outputs, metrics
+
+
+# Check program arguments. Options start with '--' and can go anywhere.
+options = [argument for argument in argv[1:] if argument.startswith('--')]
+arguments = [argument for argument in argv if not argument.startswith('--')]
+arg_length = len(arguments)
 
 if arg_length != 3:
     print(f'Expected three program arguments. Got {arg_length}.')
     exit()
 
-chapter = argv[1]
-custom_interpreter = argv[2]
+# With --batch, the whole chapter runs through a single interpreter process.
+batch = '--batch' in options
+# The number of slowest tests and largest slowdowns to print.
+slowest = 10
+# Flags passed on to the interpreter being tested, such as
+# --interpreter-arg=--compile to run the chapter with the compiler.
+interpreter_args = []
+
+for option in options:
+    if option.startswith('--slowest='):
+        slowest = int(option[len('--slowest='):])
+    elif option.startswith('--interpreter-arg='):
+        interpreter_args.append(option[len('--interpreter-arg='):])
+    elif option != '--batch':
+        print(f'Unexpected option \'{option}\'.')
+        exit()
+
+chapter = arguments[1]
+custom_interpreter = arguments[2]
 
 if chapter not in chapters.keys():
     print(f'Unexpected chapter \'{chapter}\'.')
@@ -1125,7 +1231,12 @@ if not path.exists(custom_interpreter):
 tests = [f'{crafting_interpreters_dir}/{test}' for test in chapters[chapter]]
 
 # Get test results for validation and training interpreter.
-results = {}
+results = []
+
+if batch:
+    batch_outputs, batch_metrics = run_batch([custom_interpreter, *interpreter_args], tests)
+else:
+    batch_outputs, batch_metrics = {}, None
 
 with open('test_results.txt', 'w') as file:
     passed_tests = 0
@@ -1135,45 +1246,44 @@ with open('test_results.txt', 'w') as file:
         print(f'Running test {i + 1} of {len(tests)} {test}... ', end='')
         print(f'{crafting_interpreters_dir}/gen/{chapter}/test.jar')
 
-        with Popen(['java', '-jar', f'{crafting_interpreters_dir}/gen/{chapter}/test.jar', test], stdin=PIPE, stdout=PIPE, stderr=STDOUT, universal_newlines=True) as validation:
-            try:
-                validation.wait(timeout=10)
-            except TimeoutExpired:
-                validation.terminate()
+        validation_output, validation_metrics = measure(['java', '-jar', f'{crafting_interpreters_dir}/gen/{chapter}/test.jar', test], 10)
+        validation_output = validation_output.decode(errors='replace')
 
-            validation_output, _ = validation.communicate()
-
-        with Popen([custom_interpreter, test], stdin=PIPE, stdout=PIPE, stderr=STDOUT, universal_newlines=True) as training:
-            try:
-                training.wait(timeout=10)
-            except TimeoutExpired:
-                training.terminate()
-
-            training_output, _ = training.communicate()
+        # A batch is measured as a whole, so its tests have no metrics of
+        # their own.
+        if batch:
+            training_output = batch_outputs.get(test, '')
+            training_metrics = None
+            # A test cut off by the batch being killed didn't finish.
+            timed_out = batch_metrics['timed_out'] and test not in batch_outputs
+        else:
+            training_output, training_metrics = measure([custom_interpreter, *interpreter_args, test], 10)
+            training_output = training_output.decode(errors='replace')
+            timed_out = training_metrics['timed_out']
 
         validation_output = validation_output.strip()
         training_output = training_output.strip()
 
-        if validation_output == None:
-            validation_output = ''
-
-        if training_output == None:
-            training_output = ''
-
         lines = []
 
-        passed = validation_output == training_output
+        passed = validation_output == training_output and not timed_out
 
         if passed:
             passed_tests += 1
             print('[PASS]')
             lines.append('[PASS]')
+        elif timed_out:
+            failed_tests += 1
+            print('[TIMEOUT]')
+            lines.append('[TIMEOUT]')
         else:
             failed_tests += 1
             print('[FAIL]')
             lines.append('[FAIL]')
 
         lines.append(test)
+        lines.append(f'[Validation time] {describe(validation_metrics)}')
+        lines.append(f'[Training time] {describe(training_metrics)}')
 
         if not passed:
             lines.extend([
@@ -1187,5 +1297,42 @@ with open('test_results.txt', 'w') as file:
 
         file.writelines('\n'.join(lines))
 
+        results.append({
+            'test': test,
+            'passed': passed,
+            'timed_out': timed_out,
+            'validation': validation_metrics,
+            'training': training_metrics,
+        })
+
     file.write(f'Passed {passed_tests}. Failed {failed_tests}.')
     print(f'Passed {passed_tests}. Failed {failed_tests}.')
+
+with open('test_results.json', 'w') as file:
+    dump({
+        'chapter': chapter,
+        'passed': passed_tests,
+        'failed': failed_tests,
+        'batch': batch_metrics,
+        'tests': results,
+    }, file, indent=2)
+
+# Only tests whose interpreter ran on its own have metrics to compare.
+measured = [result for result in results if result['training'] is not None]
+
+if batch_metrics is not None:
+    print(f'\nBatch: {describe(batch_metrics)}')
+
+if measured:
+    print(f'\nSlowest {slowest} tests:')
+
+    for result in sorted(measured, key=lambda result: -result['training']['wall_seconds'])[:slowest]:
+        print(f'{result["training"]["wall_seconds"]:8.3f}s  {result["test"]}')
+
+    print(f'\nLargest {slowest} slowdowns against the reference:')
+
+    def slowdown(result):
+        return result['training']['wall_seconds'] / max(result['validation']['wall_seconds'], 1e-9)
+
+    for result in sorted(measured, key=slowdown, reverse=True)[:slowest]:
+        print(f'{slowdown(result):8.2f}x  {result["test"]}')
@@ -1,3 +1,3 @@
 #!/bin/bash
 ./build.sh
-python3 test.py $1 ./bin/lox-lang-crystal
\ No newline at end of file
+python3 test.py $1 ./bin/lox-lang-crystal "${@:2}"
\ No newline at end of file